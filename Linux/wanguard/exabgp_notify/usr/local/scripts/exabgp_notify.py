@@ -10,21 +10,39 @@
 # - Throttling/dedup controls and VERBOSE debug
 
 import os
+import json
 import re
 import sys
 import time
 import ssl
 import smtplib
-from urllib import request, parse
-from collections import deque
+import http.client
+import queue
+import selectors
+import threading
+from functools import lru_cache
+from html import escape
+from collections import OrderedDict, namedtuple
 from email.message import EmailMessage
 from email.utils import getaddresses, parseaddr, formatdate, make_msgid
 
 VERSION = "0.1.3"
 DEFAULT_CONFIG_PATH = "/etc/exabgp-notify/exabgp-notify.cfg"
+TELEGRAM_HOST = "api.telegram.org"
+READ_SIZE = 65536           # bytes per os.read() on STDIN
+SCAN_SIZE = 262144          # max bytes accumulated from a backlog per regex pass
+DISPATCH_QUEUE_SIZE = 256   # pending notifications per channel before new events are dropped
+TG_BATCH_MAX = 10           # events coalesced into one Telegram message
+TG_BATCH_WAIT = 0.5         # seconds to wait for more events before sending a batch
+TG_MAX_LEN = 4096           # Telegram sendMessage text limit
+FIELD_MAX_LEN = 128         # bytes kept per log field, so one event's HTML stays under TG_MAX_LEN
+EMAIL_BATCH_MAX = 20        # events merged into one email when they queue up
+SMTP_IDLE_SEC = 60          # close the reused SMTP session after this long unused
+DEDUP_MAX_KEYS = 10000      # hard cap on remembered dedup keys (flap storms)
 
 # ---------------- Config helpers ----------------
 def load_envfile(path):
+    # Values are stored trimmed and unquoted
     cfg = {}
     try:
         with open(path, "r", encoding="utf-8") as f:
@@ -34,87 +52,198 @@ def load_envfile(path):
                     continue
                 k, v = line.split("=", 1)
                 k, v = k.strip(), v.strip()
+                if v[:1] == '"' and v[-1:] != '"':
+                    # Quoted value followed by an inline comment: KEY="value"   # comment
+                    end = v.find('"', 1)
+                    rest = v[end + 1:]
+                    if end > 0 and rest[:1] in (" ", "\t") and rest.lstrip().startswith("#"):
+                        v = v[:end + 1]
                 if len(v) >= 2 and v[0] == '"' and v[-1] == '"':
-                    v = v[1:-1]
+                    v = v[1:-1].strip()
                 cfg[k] = v
     except FileNotFoundError:
         pass
     return cfg
 
 def getenv(cfg, key, default=""):
-    return cfg.get(key, os.getenv(key, default)).strip()
+    if key in cfg:
+        return cfg[key]
+    return os.getenv(key, default).strip()
 
 def getenv_int(cfg, key, default):
-    try:
-        return int(getenv(cfg, key, str(default)))
-    except Exception:
-        return default
+    # Non-negative integers only (ports, seconds, counts); anything else falls back
+    val = getenv(cfg, key, "")
+    if val.isascii() and val.isdigit():
+        return int(val)
+    if val:
+        print(f"[exabgp_notify] invalid integer for {key}: {val!r}, using {default}", file=sys.stderr)
+    return default
 
 def getenv_bool(cfg, key, default=False):
     raw = getenv(cfg, key, "1" if default else "0").lower()
     return raw in ("1", "true", "yes", "on")
 
+Settings = namedtuple("Settings", [
+    "only_actions", "throttle_window", "throttle_max", "dedup_ttl", "dry_run", "verbose",
+    "tg_token", "tg_chat",
+    "smtp_host", "smtp_port", "smtp_user", "smtp_pass", "mail_from", "mail_to", "smtp_ssl", "smtp_starttls",
+])
+
+def load_settings(cfg):
+    # Resolves every setting once at startup
+    smtp_port = getenv_int(cfg, "SMTP_PORT", 587)
+    return Settings(
+        only_actions    = frozenset(x.strip().lower() for x in getenv(cfg, "ONLY_ACTIONS", "added,removed").split(",") if x.strip()),
+        throttle_window = getenv_int(cfg, "THROTTLE_WINDOW_SEC", 60),
+        throttle_max    = getenv_int(cfg, "THROTTLE_MAX", 30),
+        dedup_ttl       = getenv_int(cfg, "DEDUP_TTL_SEC", 60),
+        dry_run         = getenv_bool(cfg, "DRY_RUN", False),
+        verbose         = getenv_bool(cfg, "VERBOSE", False),
+        # Channels
+        tg_token        = getenv(cfg, "TELEGRAM_BOT_TOKEN", ""),
+        tg_chat         = getenv(cfg, "TELEGRAM_CHAT_ID", ""),
+        # SMTP/TLS
+        smtp_host       = getenv(cfg, "SMTP_HOST", ""),
+        smtp_port       = smtp_port,
+        smtp_user       = getenv(cfg, "SMTP_USER", ""),
+        smtp_pass       = getenv(cfg, "SMTP_PASS", ""),
+        mail_from       = getenv(cfg, "MAIL_FROM", ""),
+        mail_to         = getenv(cfg, "MAIL_TO", ""),
+        smtp_ssl        = getenv_bool(cfg, "SMTP_SSL", smtp_port == 465),
+        smtp_starttls   = getenv_bool(cfg, "SMTP_STARTTLS", True),
+    )
+
 # ---------------- Senders ----------------
+_TLS_CTX = None  # shared client TLS context (CA bundle loaded once)
+_TG_CONN = None  # kept-alive HTTPS connection to the Telegram API
+TG_HEADERS = {"Content-Type": "application/json", "Connection": "keep-alive"}
+# Errors from a socket the server already closed; safe to resend (unlike a read timeout)
+TG_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+def tls_context():
+    global _TLS_CTX
+    if _TLS_CTX is None:
+        _TLS_CTX = ssl.create_default_context()
+    return _TLS_CTX
+
+def telegram_connect():
+    # Opens (or reuses) the kept-alive Telegram connection
+    global _TG_CONN
+    if _TG_CONN is None:
+        conn = http.client.HTTPSConnection(TELEGRAM_HOST, 443, timeout=10, context=tls_context())
+        conn.connect()
+        _TG_CONN = conn
+    return _TG_CONN
+
 def send_telegram(bot_token, chat_id, text):
+    global _TG_CONN
     if not (bot_token and chat_id):
         return
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     data = {"chat_id": chat_id, "text": text, "disable_web_page_preview": True, "parse_mode": "HTML"}
-    req = request.Request(url, data=parse.urlencode(data).encode("utf-8"), method="POST")
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    for attempt in range(2):
+        try:
+            telegram_connect().request("POST", f"/bot{bot_token}/sendMessage", body, TG_HEADERS)
+            r = _TG_CONN.getresponse()
+            payload = r.read()
+        except (http.client.HTTPException, OSError) as e:
+            if _TG_CONN is not None:
+                _TG_CONN.close()
+                _TG_CONN = None
+            if attempt == 0 and isinstance(e, TG_STALE_ERRORS):
+                continue  # idle keep-alive socket was closed by the server; retry on a fresh one
+            print(f"[exabgp_notify] telegram error: {e}", file=sys.stderr)
+            return
+        if r.status != 200:
+            print(f"[exabgp_notify] telegram error: HTTP {r.status} {payload[:200]!r}", file=sys.stderr)
+        return
+
+_SMTP = None  # authenticated SMTP session reused across events
+
+def _smtp_connect(smtp_host, smtp_port, smtp_user, smtp_pass, smtp_ssl, smtp_starttls):
+    ctx = tls_context()
+    if smtp_ssl:
+        s = smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=10)
+    else:
+        s = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
     try:
-        with request.urlopen(req, timeout=10) as r:
-            r.read()
-    except Exception as e:
-        print(f"[exabgp_notify] telegram error: {e}", file=sys.stderr)
+        s.ehlo()
+        if not smtp_ssl and smtp_starttls:
+            try:
+                s.starttls(context=ctx)
+                s.ehlo()
+            except smtplib.SMTPException:
+                pass
+        if smtp_user and smtp_pass:
+            s.login(smtp_user, smtp_pass)
+    except Exception:
+        s.close()
+        raise
+    return s
+
+def _smtp_close():
+    global _SMTP
+    if _SMTP is None:
+        return
+    try:
+        _SMTP.quit()
+    except Exception:
+        _SMTP.close()
+    _SMTP = None
+
+def _get_smtp(smtp_host, smtp_port, smtp_user, smtp_pass, smtp_ssl, smtp_starttls):
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            code = _SMTP.noop()[0]
+        except (smtplib.SMTPException, OSError):
+            code = None
+        if code == 250:
+            return _SMTP
+        _smtp_close()
+    _SMTP = _smtp_connect(smtp_host, smtp_port, smtp_user, smtp_pass, smtp_ssl, smtp_starttls)
+    return _SMTP
+
+@lru_cache(maxsize=8)
+def parse_addresses(mail_from, mail_to_csv):
+    # Robust parse: commas/semicolons/names are OK
+    to_list = [addr for _, addr in getaddresses([mail_to_csv]) if addr]
+    # Envelope sender must be a plain address
+    envelope_from = parseaddr(mail_from)[1] or mail_from
+    return envelope_from, tuple(to_list), ", ".join(to_list)
 
 def send_email(
     smtp_host, smtp_port, smtp_user, smtp_pass,
     mail_from, mail_to_csv, subject, body,
     smtp_ssl=False, smtp_starttls=True
 ):
+    global _SMTP
     # Need host, from and list of recipients
     if not (smtp_host and mail_from and mail_to_csv):
         return
 
-    # Robust parse: commas/semicolons/names are OK
-    to_list = [addr for _, addr in getaddresses([mail_to_csv]) if addr]
+    envelope_from, to_list, to_header = parse_addresses(mail_from, mail_to_csv)
     if not to_list:
         return
 
-    # Envelope sender must be a plain address
-    envelope_from = parseaddr(mail_from)[1] or mail_from
-
     msg = EmailMessage()
     msg["From"] = mail_from
-    msg["To"] = ", ".join(to_list)
+    msg["To"] = to_header
     msg["Subject"] = subject
     msg["Date"] = formatdate(localtime=True)
     msg["Message-ID"] = make_msgid()
     msg.set_content(body)
 
-    ctx = ssl.create_default_context()
-    refused = {}
-
+    conn_args = (smtp_host, smtp_port, smtp_user, smtp_pass, smtp_ssl, smtp_starttls)
     try:
-        if smtp_ssl:
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=10) as s:
-                s.ehlo()
-                if smtp_user and smtp_pass:
-                    s.login(smtp_user, smtp_pass)
-                refused = s.send_message(msg, from_addr=envelope_from, to_addrs=to_list)
-        else:
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as s:
-                s.ehlo()
-                if smtp_starttls:
-                    try:
-                        s.starttls(context=ctx)
-                        s.ehlo()
-                    except smtplib.SMTPException:
-                        pass
-                if smtp_user and smtp_pass:
-                    s.login(smtp_user, smtp_pass)
-                refused = s.send_message(msg, from_addr=envelope_from, to_addrs=to_list)
+        try:
+            refused = _get_smtp(*conn_args).send_message(msg, from_addr=envelope_from, to_addrs=to_list)
+        except smtplib.SMTPServerDisconnected:
+            # Session dropped between the liveness probe and DATA: reconnect once
+            _SMTP = None
+            refused = _get_smtp(*conn_args).send_message(msg, from_addr=envelope_from, to_addrs=to_list)
     except Exception as e:
+        _smtp_close()
         print(f"[exabgp_notify] smtp error: {e}", file=sys.stderr)
         return
 
@@ -122,52 +251,231 @@ def send_email(
         print(f"[exabgp_notify] smtp refused recipients: {refused}", file=sys.stderr)
 
 # ---------------- Parser ----------------
-RE_LINE = re.compile(
-    r'^(?P<ts>\w{3},\s+\d{2}\s+\w{3}\s+\d{4}\s+\d{2}:\d{2}:\d{2}).*?\bapi\s+route\s+'
-    r'(?P<action>added|removed)\s+to\s+neighbor\s+(?P<neighbor>\d{1,3}(?:\.\d{1,3}){3}).*?:\s+'
-    r'(?P<prefix>\d{1,3}(?:\.\d{1,3}){3}/\d{1,2})\s+next-hop\s+(?P<nexthop>\d{1,3}(?:\.\d{1,3}){3})\s+'
-    r'local-preference\s+(?P<lpref>\d+)\s+community\s+(?P<comm>[\d:]+)',
-    re.IGNORECASE
+# Bytes patterns over whole buffers ([ \t], never \s, so a match stays on one line).
+# Case-sensitive: ExaBGP logs these keywords in lowercase.
+# New event kinds go into RE_EVENT as named alternatives (one scan), not a second pass.
+RE_EVENT = re.compile(
+    rb'api[ \t]+route[ \t]+(?P<action>added|removed)[ \t]+to[ \t]+neighbor[ \t]+(?P<neighbor>\S+)'
+)
+RE_TS = re.compile(rb'[ \t]*(\w{3},[ \t]+\d{2}[ \t]+\w{3}[ \t]+\d{4}[ \t]+\d{2}:\d{2}:\d{2})')  # leading blanks skipped
+RE_ROUTE = re.compile(
+    rb':[ \t]+(?P<prefix>\S+)[ \t]+next-hop[ \t]+(?P<nexthop>\S+)[ \t]+'
+    rb'local-preference[ \t]+(?P<lpref>\d+)[ \t]+community[ \t]+(?P<comm>[\d:]+)'
 )
 
-def build_text(d):
-    return (
-        f"<b>ExaBGP</b>: route <b>{d['action'].upper()}</b>\n"
-        f"Prefix: <code>{d['prefix']}</code>\n"
-        f"Next-hop: {d['nexthop']}  LP: {d['lpref']}  Community: {d['comm']}\n"
-        f"Neighbor: {d['neighbor']}\n"
-        f"When: {d['ts']}"
+def read_chunks(fd):
+    # Yields buffers of complete lines (up to SCAN_SIZE while a backlog is waiting);
+    # a partial last line is carried over until its newline arrives or EOF
+    # (lines longer than SCAN_SIZE are dropped)
+    sel = selectors.DefaultSelector()
+    try:
+        sel.register(fd, selectors.EVENT_READ)
+    except (OSError, ValueError):
+        # Regular files cannot be polled (and never block)
+        sel.close()
+        sel = None
+    tail = b""
+    skip = False  # discarding the rest of an overlong line
+    eof = False
+    try:
+        while not eof:
+            parts = [tail] if tail else []
+            size = 0
+            while True:
+                data = os.read(fd, READ_SIZE)
+                if not data:
+                    eof = True
+                    break
+                parts.append(data)
+                size += len(data)
+                if size >= SCAN_SIZE or (sel and not sel.select(0)):
+                    break
+            buf = b"".join(parts)
+            if skip:
+                nl = buf.find(b"\n")
+                if nl < 0:
+                    continue
+                buf = buf[nl + 1:]
+                skip = False
+            if eof:
+                if buf:
+                    yield buf
+                break
+            cut = buf.rfind(b"\n") + 1
+            if cut:
+                yield buf[:cut]
+                tail = buf[cut:]
+            else:
+                tail = buf
+            if len(tail) > SCAN_SIZE:
+                # No ExaBGP event line is this long: drop it up to its newline
+                tail = b""
+                skip = True
+    finally:
+        if sel:
+            sel.close()
+
+def iter_events(chunks, actions):
+    # Yields the raw groups (ts, action, neighbor, prefix, nexthop, lpref, comm)
+    # of every route event whose action is in `actions`
+    find_events = RE_EVENT.finditer
+    match_ts = RE_TS.match
+    search_route = RE_ROUTE.search
+    for buf in chunks:
+        # Cheap substring reject before the regex; must accept everything RE_EVENT does
+        if b"route" not in buf:
+            continue
+        for ev in find_events(buf):
+            action = ev.group(1)
+            if action not in actions:
+                continue
+            start = buf.rfind(b"\n", 0, ev.start()) + 1
+            ts = match_ts(buf, start)
+            if not ts:
+                continue
+            end = buf.find(b"\n", ev.end())
+            route = search_route(buf, ev.end(), end if end >= 0 else len(buf))
+            if not route:
+                continue
+            yield (ts.group(1), action, ev.group(2)) + route.groups()
+
+def build_bodies(ts, action_upper, neighbor, prefix, nexthop, lpref, comm):
+    # Returns (html, plain): Telegram gets HTML (log values escaped), email plain text
+    tail = (
+        f"Next-hop: {nexthop}  LP: {lpref}  Community: {comm}\n"
+        f"Neighbor: {neighbor}\n"
+        f"When: {ts}"
     )
-
-def strip_tags(s):
-    return re.sub(r"<[^>]+>", "", s)
+    html = f"<b>ExaBGP</b>: route <b>{action_upper}</b>\nPrefix: <code>{escape(prefix, False)}</code>\n{escape(tail, False)}"
+    plain = f"ExaBGP: route {action_upper}\nPrefix: {prefix}\n{tail}"
+    return html, plain
 
 # ---------------- Noise control ----------------
+# Both gates take the caller's time.monotonic() reading
 def make_throttler(window_sec, max_events):
-    events = deque()
-    def allowed():
-        t = int(time.time())
-        while events and (t - events[0]) > window_sec:
-            events.popleft()
-        if len(events) >= max_events:
+    # Fixed window: at most max_events per window_sec
+    state = [float("-inf"), 0]  # window start, events admitted in it
+    def allowed(now):
+        if now - state[0] >= window_sec:
+            state[0] = now
+            state[1] = 0
+        if state[1] >= max_events:
             return False
-        events.append(t)
+        state[1] += 1
         return True
     return allowed
 
-def make_dedup(ttl_sec):
-    cache = {}
-    def allowed(key):
-        t = int(time.time())
-        for k, exp in list(cache.items()):
-            if exp <= t:
-                cache.pop(k, None)
-        if key in cache:
-            return False
+def make_dedup(ttl_sec, max_size=DEDUP_MAX_KEYS, sweep_max=8):
+    # key -> expiry, oldest first (fixed TTL): expired keys are swept from the front;
+    # at max_size the oldest key is evicted early
+    cache = OrderedDict()
+    def allowed(key, t):
+        for _ in range(sweep_max):
+            if not cache:
+                break
+            k, exp = next(iter(cache.items()))
+            if exp > t:
+                break
+            del cache[k]
+        exp = cache.get(key)
+        if exp is not None:
+            if exp > t:
+                return False
+            del cache[key]
+        elif len(cache) >= max_size:
+            cache.popitem(last=False)
         cache[key] = t + ttl_sec
         return True
     return allowed
 
+# ---------------- Dispatch ----------------
+# One worker thread per channel; each consumes its queue until a None sentinel
+def telegram_worker(q, tg_token, tg_chat, verbose):
+    # Up to TG_BATCH_MAX events within TG_BATCH_WAIT go out as one message
+    pending = []
+    pending_len = 0
+    first_at = 0.0
+    try:
+        telegram_connect()
+    except (http.client.HTTPException, OSError) as e:
+        print(f"[exabgp_notify] telegram connect failed (will retry on send): {e}", file=sys.stderr)
+
+    def flush():
+        nonlocal pending_len
+        if not pending:
+            return
+        try:
+            if verbose:
+                print(f"[exabgp_notify] Sending Telegram ({len(pending)} event(s))", file=sys.stderr)
+            send_telegram(tg_token, tg_chat, "\n\n".join(pending))
+        except Exception as e:
+            print(f"[exabgp_notify] telegram dispatch failed: {e}", file=sys.stderr)
+        pending.clear()
+        pending_len = 0
+
+    while True:
+        timeout = max(0.0, first_at + TG_BATCH_WAIT - time.monotonic()) if pending else None
+        try:
+            html = q.get(timeout=timeout)
+        except queue.Empty:
+            flush()
+            continue
+        if html is None:
+            break
+        if pending and pending_len + 2 + len(html) > TG_MAX_LEN:
+            flush()
+        if not pending:
+            first_at = time.monotonic()
+        pending.append(html)
+        pending_len += len(html) + (2 if len(pending) > 1 else 0)
+        if len(pending) >= TG_BATCH_MAX:
+            flush()
+
+    flush()
+
+def email_worker(q, email, verbose):
+    # Events queued meanwhile (up to EMAIL_BATCH_MAX) are merged into one email;
+    # the SMTP session is closed after SMTP_IDLE_SEC idle
+    done = False
+    while not done:
+        try:
+            item = q.get(timeout=SMTP_IDLE_SEC)
+        except queue.Empty:
+            _smtp_close()
+            continue
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < EMAIL_BATCH_MAX:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                done = True
+                break
+            batch.append(item)
+
+        if len(batch) == 1:
+            subj, body = batch[0]
+        else:
+            subj = f"ExaBGP: {len(batch)} route events"
+            body = "\n\n".join(plain for _, plain in batch)
+        try:
+            if verbose:
+                print(f"[exabgp_notify] Sending Email ({len(batch)} event(s)) -> {email['mail_to_csv']} (SSL={email['smtp_ssl']}, STARTTLS={email['smtp_starttls']}, PORT={email['smtp_port']})", file=sys.stderr)
+            send_email(subject=subj, body=body, **email)
+        except Exception as e:
+            print(f"[exabgp_notify] email dispatch failed: {e}", file=sys.stderr)
+
+    _smtp_close()
+
+def start_worker(name, target, *args):
+    q = queue.Queue(maxsize=DISPATCH_QUEUE_SIZE)
+    t = threading.Thread(target=target, args=(q,) + args, name=name, daemon=True)
+    t.start()
+    return q, t
+
 # ---------------- Main ----------------
 def main():
     # Config path
@@ -179,81 +487,77 @@ def main():
         except Exception:
             print("[exabgp_notify] --config requires a file path", file=sys.stderr)
             sys.exit(2)
-    cfg = load_envfile(cfg_path)
-
-    # Settings
-    only_actions    = {x.strip().lower() for x in getenv(cfg, "ONLY_ACTIONS", "added,removed").split(",") if x.strip()}
-    throttle_window = getenv_int(cfg, "THROTTLE_WINDOW_SEC", 60)
-    throttle_max    = getenv_int(cfg, "THROTTLE_MAX", 30)
-    dedup_ttl       = getenv_int(cfg, "DEDUP_TTL_SEC", 60)
-    dry_run         = getenv_bool(cfg, "DRY_RUN", False)
-    verbose         = getenv_bool(cfg, "VERBOSE", False)
+    st = load_settings(load_envfile(cfg_path))
 
-    allowed_by_rate  = make_throttler(throttle_window, throttle_max)
-    allowed_by_dedup = make_dedup(dedup_ttl)
+    # Matched as-is against the raw (always lowercase) regex group
+    only_actions_b = frozenset(x.encode() for x in st.only_actions)
+    dry_run = st.dry_run
+    verbose = st.verbose
 
-    # Channels
-    tg_token = getenv(cfg, "TELEGRAM_BOT_TOKEN", "")
-    tg_chat  = getenv(cfg, "TELEGRAM_CHAT_ID", "")
-
-    # SMTP/TLS
-    smtp_host = getenv(cfg, "SMTP_HOST", "")
-    smtp_port = getenv_int(cfg, "SMTP_PORT", 587)
-    smtp_user = getenv(cfg, "SMTP_USER", "")
-    smtp_pass = getenv(cfg, "SMTP_PASS", "")
-    mail_from = getenv(cfg, "MAIL_FROM", "")
-    mail_to   = getenv(cfg, "MAIL_TO", "")
-    smtp_ssl = getenv_bool(cfg, "SMTP_SSL", smtp_port == 465)
-    smtp_starttls = getenv_bool(cfg, "SMTP_STARTTLS", True)
-
-    for raw in sys.stdin:
-        line = raw.strip()
-        if not line:
-            continue
-        m = RE_LINE.search(line)
-        if not m:
-            continue
-
-        d = m.groupdict()
-        action = d["action"].lower()
-        if action not in only_actions:
-            continue
+    allowed_by_rate  = make_throttler(st.throttle_window, st.throttle_max)
+    allowed_by_dedup = make_dedup(st.dedup_ttl)
 
-        text = build_text(d)
-        subj = f"ExaBGP: route {d['action'].upper()} {d['prefix']} (nh {d['nexthop']})"
-        key  = f"{d['action']}|{d['prefix']}|{d['neighbor']}"
+    email = dict(
+        smtp_host=st.smtp_host, smtp_port=st.smtp_port, smtp_user=st.smtp_user, smtp_pass=st.smtp_pass,
+        mail_from=st.mail_from, mail_to_csv=st.mail_to, smtp_ssl=st.smtp_ssl, smtp_starttls=st.smtp_starttls,
+    )
 
+    # Per-channel delivery workers (none in DRY_RUN, which sends nothing)
+    tg_q = email_q = None
+    workers = []
+    if st.tg_token and st.tg_chat and not dry_run:
+        tg_q, t = start_worker("telegram", telegram_worker, st.tg_token, st.tg_chat, verbose)
+        workers.append((tg_q, t))
+    if st.smtp_host and st.mail_from and st.mail_to and not dry_run:
+        email_q, t = start_worker("email", email_worker, email, verbose)
+        workers.append((email_q, t))
+    dropped = 0
+
+    # Locals for the per-event path
+    monotonic = time.monotonic
+    build = build_bodies
+    stderr = sys.stderr
+
+    # Only route events with a wanted action reach this loop
+    for g in iter_events(read_chunks(sys.stdin.fileno()), only_actions_b):
         if verbose:
-            print(f"[exabgp_notify] MATCH: action={action} prefix={d['prefix']} nh={d['nexthop']} neighbor={d['neighbor']}", file=sys.stderr)
+            print(f"[exabgp_notify] MATCH: action={g[1].decode()} prefix={g[3].decode(errors='replace')} nh={g[4].decode(errors='replace')} neighbor={g[2].decode(errors='replace')}", file=stderr)
 
-        if not allowed_by_dedup(key):
+        # Admission first, on the raw groups
+        now = monotonic()
+        if not allowed_by_dedup((g[1], g[3], g[2]), now):
             if verbose:
-                print("[exabgp_notify] SUPPRESSED by dedup", file=sys.stderr)
+                print("[exabgp_notify] SUPPRESSED by dedup", file=stderr)
             continue
-        if not allowed_by_rate():
+        if not allowed_by_rate(now):
             if verbose:
-                print("[exabgp_notify] SUPPRESSED by throttling", file=sys.stderr)
+                print("[exabgp_notify] SUPPRESSED by throttling", file=stderr)
             continue
 
+        ts, action, neighbor, prefix, nexthop, lpref, comm = [x[:FIELD_MAX_LEN].decode("utf-8", "replace") for x in g]
+        action_upper = action.upper()
+        html, plain = build(ts, action_upper, neighbor, prefix, nexthop, lpref, comm)
+        subj = f"ExaBGP: route {action_upper} {prefix} (nh {nexthop})"
+
         if dry_run:
-            print(f"[DRY_RUN] {strip_tags(text)}", file=sys.stderr)
+            print(f"[DRY_RUN] {plain}", file=stderr)
             continue
 
-        try:
-            if tg_token and tg_chat:
-                if verbose:
-                    print("[exabgp_notify] Sending Telegram", file=sys.stderr)
-                send_telegram(tg_token, tg_chat, text)
-        except Exception as e:
-            print(f"[exabgp_notify] telegram dispatch failed: {e}", file=sys.stderr)
-
-        try:
-            if smtp_host and mail_from and mail_to:
-                if verbose:
-                    print(f"[exabgp_notify] Sending Email -> {mail_to} (SSL={smtp_ssl}, STARTTLS={smtp_starttls}, PORT={smtp_port})", file=sys.stderr)
-                send_email(smtp_host, smtp_port, smtp_user, smtp_pass, mail_from, mail_to, subj, strip_tags(text), smtp_ssl=smtp_ssl, smtp_starttls=smtp_starttls)
-        except Exception as e:
-            print(f"[exabgp_notify] email dispatch failed: {e}", file=sys.stderr)
+        # Best effort: never block the reader on a stuck channel, drop instead
+        for name, q, item in (("telegram", tg_q, html), ("email", email_q, (subj, plain))):
+            if q is None:
+                continue
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                dropped += 1
+                print(f"[exabgp_notify] {name} queue full, event dropped ({dropped} total)", file=stderr)
+
+    # EOF: let the workers drain what is queued, then stop
+    for q, t in workers:
+        q.put(None)
+    for q, t in workers:
+        t.join()
 
 if __name__ == "__main__":
     try: